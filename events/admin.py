@@ -26,6 +26,9 @@ class EventAdmin(admin.ModelAdmin):
         "make_private"
     )
     list_filter = ("ticket_price", "category", "make_private")
+    list_select_related = ("category",)
+    list_per_page = 50
+    show_full_result_count = False
     search_fields = ["name", "venue", "host", ]
     ordering = ("date_of_event",)
     prepopulated_fields = {"slug": ("name",)}
@@ -36,3 +39,4 @@ class EventAdmin(admin.ModelAdmin):
 class CommentAdmin(admin.ModelAdmin):
     list_display = ("username", "comment", "event")
     list_filter = ("event",)
+    list_select_related = ("event",)
@@ -83,14 +83,29 @@ class Event(models.Model):
     
     class Meta:
         ordering = ('-date_posted',)
+        indexes = [
+            models.Index(fields=["make_private", "-date_of_event"]),
+            models.Index(fields=["user", "make_private"]),
+        ]
 
     def __str__(self):
         return f"{self.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get("name")
+        instance._loaded_slug = instance.__dict__.get("slug")
+        return instance
+
     def save(self, *args, **kwargs):
-        if not self.slug:
+        renamed = self.name != getattr(self, "_loaded_name", self.name)
+        slug_edited = self.slug != getattr(self, "_loaded_slug", self.slug)
+        if not self.slug or (renamed and not slug_edited):
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+        self._loaded_name = self.name
+        self._loaded_slug = self.slug
         if self.attending:
             self.users_attending.add(self.user)
 
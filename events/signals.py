@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Event
+
+
+CATEGORY_LIST_CACHE_KEY = "cat_list_v1"
+EVENTS_VERSION_CACHE_KEY = "events_version"
+
+
+# The version is seeded from the clock so that a culled counter never restarts
+# at a value some still-cached fragment was stored under.
+def get_events_version():
+    return cache.get_or_set(EVENTS_VERSION_CACHE_KEY, time.time_ns, None)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def clear_category_list_cache(sender, **kwargs):
+    cache.delete(CATEGORY_LIST_CACHE_KEY)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(m2m_changed, sender=Event.users_attending.through)
+def bump_events_version(sender, **kwargs):
+    if not kwargs.get("action", "post_").startswith("post_"):
+        return
+    try:
+        cache.incr(EVENTS_VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(EVENTS_VERSION_CACHE_KEY, time.time_ns(), None)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def bump_events_version_on_profile_change(sender, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which the homepage never renders.
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    bump_events_version(sender)
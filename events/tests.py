@@ -2,11 +2,14 @@ from datetime import datetime, timedelta
 from pprint import pprint
 from model_bakery import baker
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
 from django.urls import reverse
 from django.http import HttpRequest
 
+from taggit.models import Tag
+
 from accounts.models import CustomUser
 
 from .forms import AddEventForm
@@ -50,6 +53,9 @@ class BaseSetUp(TestCase):
             tags="Test",
         )
 
+    def setUp(self):
+        cache.clear()
+
 
 # Model tests.
 class CategoryModelTest(BaseSetUp):
@@ -69,6 +75,19 @@ class EventModelTest(BaseSetUp):
     def test_get_absolute_url(self):
         self.assertEqual(self.event.get_absolute_url(), "/events/test-event/")
 
+    def test_slug_follows_renamed_event(self):
+        event = Event.objects.get(id=self.event.id)
+        event.name = "renamed event"
+        event.save()
+        self.assertEqual(event.slug, "renamed-event")
+
+    def test_explicit_slug_kept_when_renaming(self):
+        event = Event.objects.get(id=self.event.id)
+        event.name = "renamed event"
+        event.slug = "custom-slug"
+        event.save()
+        self.assertEqual(event.slug, "custom-slug")
+
     def test_past_event_date(self):
         time = timezone.now() -  timedelta(days=1)
         event = Event(name="Halloween", date_of_event=time)
@@ -96,12 +115,26 @@ class GetEventFunctionTest(BaseSetUp):
 
 
 class IndexViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
     def test_index_page(self):
         response = self.client.get("/")
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "index.html")
         self.assertContains(response, "Welcome to Evnts")
 
+    def test_cached_index_page_never_shows_a_signed_in_user(self):
+        CustomUser.objects.create_user(
+            username="alice", password="password1234", email="alice@events.com"
+        )
+        self.client.login(username="alice", password="password1234")
+        self.assertContains(self.client.get("/"), "alice")
+        self.client.logout()
+        self.assertNotContains(self.client.get("/"), "alice")
+        self.client.login(username="alice", password="password1234")
+        self.assertContains(self.client.get("/"), "alice")
+
     def test_indexpage_url_exists_by_name(self):
         response = self.client.get(reverse("events:index"))
         self.assertEqual(response.status_code, 200)
@@ -121,6 +154,19 @@ class CategoriesListViewTest(BaseSetUp):
         self.assertTemplateUsed(response, "categories.html")
         self.assertContains(response, "Categories")
 
+    def test_new_event_clears_cached_category_list(self):
+        self.client.get("/categories/")
+        Event.objects.create(
+            user=self.user,
+            category=self.category,
+            name="cached event",
+            description="testing the category list cache",
+            venue="The Slum",
+            date_of_event=datetime(2022, 9, 1),
+        )
+        response = self.client.get("/categories/")
+        self.assertContains(response, "cached event")
+
 
 class CategoryDetailViewTest(BaseSetUp):
     def test_view_url(self):
@@ -136,6 +182,10 @@ class CategoryDetailViewTest(BaseSetUp):
         self.assertTemplateUsed(response, "category.html")
         self.assertContains(response, "Category: Wedding")
 
+    def test_unknown_category_returns_404(self):
+        response = self.client.get("/category/unknown/")
+        self.assertEqual(response.status_code, 404)
+
 
 class EventsListViewTest(BaseSetUp):
     def test_view_url(self):
@@ -151,6 +201,34 @@ class EventsListViewTest(BaseSetUp):
         self.assertTemplateUsed(response, "homepage.html")
         self.assertContains(response, "Evnts")
 
+    def test_event_changes_refresh_cached_events(self):
+        self.client.get("/home/")
+        event = Event.objects.get(id=self.event.id)
+        event.name = "renamed event"
+        event.save()
+        response = self.client.get("/home/")
+        self.assertContains(response, "renamed event")
+
+        event.users_attending.add(self.user_2)
+        response = self.client.get("/home/")
+        self.assertContains(response, "testuser_2")
+
+    def test_view_paginates_with_cursor(self):
+        for day in range(1, 26):
+            Event.objects.create(
+                user=self.user,
+                category=self.category,
+                name=f"paged event {day}",
+                description="testing keyset pagination",
+                venue="The Slum",
+                date_of_event=datetime(2022, 10, day),
+            )
+        response = self.client.get("/home/")
+        self.assertEqual(len(response.context["events"]), 25)
+        response = self.client.get("/home/", {"before": response.context["next_cursor"]})
+        self.assertQuerysetEqual(response.context["events"], [self.event, ])
+        self.assertIsNone(response.context["next_cursor"])
+
 
 class EventDetailViewTest(BaseSetUp):
     def test_view_url(self):
@@ -174,6 +252,29 @@ class EventDetailViewTest(BaseSetUp):
         self.assertRedirects(response, "/events/test-event/")
 
 
+class EventTagViewTest(BaseSetUp):
+    def setUp(self):
+        super().setUp()
+        event = Event.objects.get(id=self.event.id)
+        event.tags.add("secret")
+        Event.objects.filter(id=event.id).update(make_private=True)
+
+    def test_private_event_hidden_from_anonymous_users(self):
+        response = self.client.get("/events/tags/secret/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "test event")
+
+    def test_private_event_hidden_from_other_users(self):
+        self.client.login(username="testuser_2", password="4321drowssap")
+        response = self.client.get("/events/tags/secret/")
+        self.assertNotContains(response, "test event")
+
+    def test_private_event_visible_to_its_owner(self):
+        self.client.login(username="testuser", password="password1234")
+        response = self.client.get("/events/tags/secret/")
+        self.assertContains(response, "test event")
+
+
 class PrivateEventViewTest(BaseSetUp):
     def test_view_url(self):
         self.client.login(username="testuser", password="password1234")
@@ -320,6 +421,54 @@ class EditEventViewTest(BaseSetUp):
         self.assertEqual(get_response.status_code, post_response.status_code, 403)
 
 
+class EventTagsTest(BaseSetUp):
+    def event_data(self, tags):
+        return {
+            "category": self.category.id,
+            "name": "tagged event",
+            "description": "testing event tags",
+            "venue": "test venue",
+            "date_of_event": "2030-01-01 10:00:00",
+            "ticket_price": "12",
+            "tags": tags,
+        }
+
+    def test_add_and_edit_event_tags(self):
+        tagged = Event.objects.get(id=self.event.id)
+        tagged.tags.add("Test")
+        self.client.login(username="testuser", password="password1234")
+        self.client.post("/add-event/", self.event_data("Test, fresh, test"))
+        event = Event.objects.get(slug="tagged-event")
+        self.assertEqual(sorted(event.tags.names()), ["Test", "fresh", "test"])
+        self.assertNotEqual(
+            Tag.objects.get(name="test").slug, Tag.objects.get(name="Test").slug
+        )
+
+        self.client.post(
+            "/events/tagged-event/edit-event/", self.event_data("test, other")
+        )
+        self.assertEqual(sorted(event.tags.names()), ["other", "test"])
+        self.assertEqual(list(tagged.tags.names()), ["Test"])
+
+
+class AttendlistViewTest(BaseSetUp):
+    def test_other_attendees_count_only_public_events(self):
+        private_event = Event.objects.create(
+            user=self.user_2,
+            category=self.category,
+            name="private event",
+            description="testing the attend-list count",
+            venue="The Slum",
+            date_of_event=datetime(2022, 9, 1),
+        )
+        for event in (Event.objects.get(id=self.event.id), private_event):
+            event.users_attending.add(self.user, self.user_2)
+        Event.objects.filter(id=private_event.id).update(make_private=True)
+        self.client.login(username="testuser", password="password1234")
+        response = self.client.get("/m/attend-list/")
+        self.assertEqual(response.context["users"], 1)
+
+
 class DeleteEventViewTest(BaseSetUp):
     def test_view_url(self):
         self.client.login(username="testuser", password="password1234")
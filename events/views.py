@@ -1,34 +1,136 @@
+from datetime import datetime
+from typing import Optional
+
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
-from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Count, Prefetch, Q, Subquery, prefetch_related_objects
+from django.http import Http404, HttpRequest, HttpResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect, render
-from django.utils.text import slugify
 from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
 from django.views import View
+from django.views.decorators.cache import cache_page
 
-from taggit.models import Tag
+from taggit.models import Tag, TaggedItem
 
 from .forms import AddEventForm, CommentForm, EditEventForm
 from .models import Category, Event
+from .signals import CATEGORY_LIST_CACHE_KEY, get_events_version
+
+
+# Columns rendered by the event list templates.
+EVENT_LIST_FIELDS = (
+    "user",
+    "category",
+    "name",
+    "slug",
+    "image",
+    "description",
+    "date_posted",
+    "date_of_event",
+    "make_private",
+)
 
 
 # Create your views here.
 def get_event(slug: str) -> Event:
-    queryset = get_object_or_404(Event, slug=slug, make_private=False)
+    queryset = get_object_or_404(
+        Event.objects.select_related("category", "user").prefetch_related(
+            "tags", "comments", "users_attending"
+        ),
+        slug=slug,
+        make_private=False,
+    )
     return queryset
 
 
 def get_private_event(slug: str) -> Event:
-    queryset = get_object_or_404(Event, slug=slug, make_private=True)
+    queryset = get_object_or_404(
+        Event.objects.select_related("category", "user").prefetch_related("tags"),
+        slug=slug,
+        make_private=True,
+    )
     return queryset
 
 
+def set_event_tags(event: Event, names: list) -> None:
+    content_type = ContentType.objects.get_for_model(Event)
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list("name", "id"))
+    # Bulk-insert only new tags whose slug is free; anything that could collide
+    # goes through Tag.save() below, which picks a unique "<slug>_<n>".
+    new_tags = {}
+    for name in names:
+        if name not in tag_ids:
+            new_tags.setdefault(Tag().slugify(name), name)
+    taken = set(Tag.objects.filter(slug__in=new_tags).values_list("slug", flat=True))
+    Tag.objects.bulk_create(
+        [
+            Tag(name=name, slug=slug)
+            for slug, name in new_tags.items()
+            if slug not in taken
+        ],
+        ignore_conflicts=True,
+    )
+    tag_ids.update(Tag.objects.filter(name__in=names).values_list("name", "id"))
+    for name in names:
+        if name not in tag_ids:
+            tag_ids[name] = Tag.objects.get_or_create(name=name)[0].id
+    TaggedItem.objects.filter(content_type=content_type, object_id=event.id).exclude(
+        tag_id__in=tag_ids.values()
+    ).delete()
+    TaggedItem.objects.bulk_create(
+        [
+            TaggedItem(tag_id=tag_id, content_type=content_type, object_id=event.id)
+            for tag_id in tag_ids.values()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def paginate_events(queryset, cursor: Optional[str], per_page: int = 25) -> tuple:
+    queryset = queryset.order_by("-date_of_event", "-id")
+    if cursor:
+        try:
+            date, pk = cursor.rsplit("_", 1)
+            date, pk = datetime.fromisoformat(date), int(pk)
+        except ValueError:
+            pass
+        else:
+            queryset = queryset.filter(
+                Q(date_of_event__lt=date) | Q(date_of_event=date, id__lt=pk)
+            )
+    events = list(queryset[: per_page + 1])
+    next_cursor = None
+    if len(events) > per_page:
+        events = events[:per_page]
+        last = events[-1]
+        next_cursor = f"{last.date_of_event.isoformat()}_{last.id}"
+    return events, next_cursor
+
+
+def visible_events(request: HttpRequest) -> Q:
+    condition = Q(make_private=False)
+    if request.user.is_authenticated:
+        condition |= Q(make_private=True, user=request.user)
+    return condition
+
+
 class IndexView(View):
 
     template_name: str = "index.html"
 
+    cache_timeout: int = 300
+
     def get(self, request: HttpRequest) -> HttpResponse:
+        # The navbar shows the signed-in user, so only anonymous pages are shared.
+        if request.user.is_authenticated:
+            return self.render_index(request)
+        return cache_page(self.cache_timeout)(self.render_index)(request)
+
+    def render_index(self, request: HttpRequest) -> HttpResponse:
         return render(request, self.template_name)
 
 
@@ -37,30 +139,49 @@ class CategoryListView(View):
 
     template_name: str = "categories.html"
 
+    cache_timeout: int = 300
+
     def get(self, request: HttpRequest) -> HttpResponse:
-        categories = Category.objects.all()
-        events = []
-        for category in categories:
-            events.append((category, Event.public.filter(category=category)))
-        context = {
-            "categories": categories,
-            "events": events,
-        }
+        context = cache.get(CATEGORY_LIST_CACHE_KEY)
+        if context is None:
+            context = self.get_category_events()
+            cache.set(CATEGORY_LIST_CACHE_KEY, context, self.cache_timeout)
         return render(request, self.template_name, context)
 
+    def get_category_events(self) -> dict:
+        categories = list(
+            Category.objects.prefetch_related(
+                Prefetch(
+                    "events",
+                    queryset=Event.public.only(
+                        "category", "name", "slug", "make_private"
+                    ),
+                    to_attr="public_events",
+                )
+            )
+        )
+        events = [(category, category.public_events) for category in categories]
+        return {"categories": categories, "events": events}
+
 
 class CategoryDetailView(View):
 
     template_name: str = "category.html"
 
+    cache_timeout: int = 60
+
     def get(self, request: HttpRequest, slug: str) -> HttpResponse:
-        category = Category.objects.get(slug=slug)
+        # Anonymous users all see the same public events, so their page can be
+        # shared; signed-in users also see their own private events.
         if request.user.is_authenticated:
-            queryset = category.events(manager="public").all() | category.events(
-                manager="private"
-            ).filter(user=request.user)
-        else:
-            queryset = category.events(manager="public").all()
+            return self.render_category(request, slug)
+        return cache_page(self.cache_timeout)(self.render_category)(request, slug)
+
+    def render_category(self, request: HttpRequest, slug: str) -> HttpResponse:
+        category = get_object_or_404(
+            Category.objects.only("id", "name", "slug", "description"), slug=slug
+        )
+        queryset = Event.objects.filter(visible_events(request), category=category)
         context = {"queryset": queryset, "category": category}
         return render(request, self.template_name, context)
 
@@ -71,8 +192,21 @@ class EventsListView(View):
     template_name: str = "homepage.html"
 
     def get(self, request: HttpRequest) -> HttpResponse:
-        events = Event.public.all()
-        context = {"events": events}
+        events, next_cursor = paginate_events(
+            Event.public.only(*EVENT_LIST_FIELDS).select_related("user"),
+            request.GET.get("before"),
+        )
+
+        # Only fetch attendees when the cached fragment has to be re-rendered.
+        def prefetch_attendees():
+            prefetch_related_objects(events, "users_attending")
+            return events
+
+        context = {
+            "events": SimpleLazyObject(prefetch_attendees),
+            "next_cursor": next_cursor,
+            "events_version": get_events_version(),
+        }
         return render(request, self.template_name, context)
 
 
@@ -84,9 +218,18 @@ class EventDetailView(View):
     def get(self, request: HttpRequest, slug: str) -> HttpResponse:
         event = get_event(slug)
         tags = event.tags.all()
-        related_events = (
-            Event.public.filter(tags__id__in=tags).exclude(id=event.id)
-        ).distinct()
+        # The tags are prefetched, so collect their ids in Python rather than
+        # letting the filter below compile them into another subquery.
+        tag_ids = [tag.id for tag in tags]
+        related_ids = (
+            TaggedItem.objects.filter(
+                content_type=ContentType.objects.get_for_model(Event),
+                tag_id__in=tag_ids,
+            )
+            .exclude(object_id=event.id)
+            .values("object_id")[:50]
+        )
+        related_events = Event.public.filter(id__in=Subquery(related_ids))[:4]
         form = self.form_class()
         comments = event.comments.all()
         context = {
@@ -100,22 +243,24 @@ class EventDetailView(View):
 
     @method_decorator(login_required)
     def post(self, request: HttpRequest, slug: str) -> HttpResponse:
-        event = get_event(slug)
-        event_action = request.POST.get(str(event.id))
+        event_id = Event.public.filter(slug=slug).values_list("id", flat=True).first()
+        if event_id is None:
+            raise Http404("No Event matches the given query.")
+        event_action = request.POST.get(str(event_id))
         if event_action == "Add to attend-list":
-            event.users_attending.add(request.user)
+            request.user.user_attend.add(event_id)
             return HttpResponse("This evnt has been added to your evnt list.")
         elif event_action == "Remove from attend-list":
-            event.users_attending.remove(request.user)
+            request.user.user_attend.remove(event_id)
             return HttpResponse("This evnt has been removed from your attend-list")
         else:
             form = self.form_class(request.POST)
             if form.is_valid():
                 comment = form.save(commit=False)
-                comment.event = get_event(slug)
+                comment.event_id = event_id
                 comment.username = request.user
                 comment.save()
-                return redirect(event.get_absolute_url())
+                return redirect("events:event-detail", slug=slug)
 
 
 class EventTagView(View):
@@ -123,8 +268,10 @@ class EventTagView(View):
     template_name: str = "event_tag.html"
 
     def get(self, request: HttpRequest, slug: str) -> HttpResponse:
-        events = Event.objects.filter(tags__slug__contains=slug)
         tag = get_object_or_404(Tag, slug=slug)
+        events = Event.objects.filter(
+            visible_events(request), tags=tag
+        ).prefetch_related("tags")
         context = {"events": events, "tag": tag}
         return render(request, self.template_name, context)
 
@@ -142,7 +289,7 @@ class PrivateEventsView(LoginRequiredMixin, View):
     template_name: str = "private_events.html"
 
     def get(self, request: HttpRequest) -> HttpResponse:
-        my_events = Event.private.filter(user=request.user)
+        my_events = Event.private.filter(user=request.user).only(*EVENT_LIST_FIELDS)
         context = {"my_events": my_events}
         return render(request, self.template_name, context)
 
@@ -154,7 +301,6 @@ class PrivateEventDetailView(LoginRequiredMixin, View):
     def get(self, request: HttpRequest, slug: str) -> HttpResponse:
         event = get_private_event(slug)
         if request.user == event.user:
-            event = Event.private.get(user=request.user, name=event)
             tags = event.tags.all()
         else:
             return HttpResponseForbidden()
@@ -177,9 +323,8 @@ class AddEventView(LoginRequiredMixin, View):
         if form.is_valid():
             event = form.save(commit=False)
             event.user = request.user
-            event.slug = slugify(event.name)
             event.save()
-            form.save_m2m()
+            set_event_tags(event, form.cleaned_data["tags"])
             messages.success(request, "Evnt posted successfully.")
             return redirect(event)
         else:
@@ -195,7 +340,7 @@ class EditEventView(LoginRequiredMixin, View):
 
     def get(self, request: HttpRequest, slug: str) -> HttpResponse:
         event = get_object_or_404(Event, slug=slug)
-        if request.user == event.user:
+        if request.user.id == event.user_id:
             form = self.form_class(instance=event)
         else:
             return HttpResponseForbidden()
@@ -203,16 +348,22 @@ class EditEventView(LoginRequiredMixin, View):
         return render(request, self.template_name, context)
 
     def post(self, request: HttpRequest, slug: str) -> HttpResponse:
-        event = get_object_or_404(Event, slug=slug)
-        if request.user == event.user:
+        event = Event.objects.filter(slug=slug, user=request.user).first()
+        if event is not None:
             form = self.form_class(
                 instance=event, data=request.POST, files=request.FILES
             )
             if form.is_valid():
                 edit = form.save(commit=False)
-                edit.slug = slugify(edit.name)
-                edit.save()
-                form.save_m2m()
+                update_fields = [
+                    field.name
+                    for field in Event._meta.concrete_fields
+                    if field.name in form.changed_data
+                ]
+                if "name" in update_fields:
+                    update_fields.append("slug")
+                edit.save(update_fields=update_fields)
+                set_event_tags(edit, form.cleaned_data["tags"])
                 messages.success(request, "Changes saved!")
                 return redirect(event.get_absolute_url())
             else:
@@ -229,15 +380,18 @@ class DeleteEventView(LoginRequiredMixin, View):
 
     def get(self, request: HttpRequest, slug: str) -> HttpResponse:
         event = get_object_or_404(Event, slug=slug)
-        if request.user.is_superuser or request.user == event.user:
+        if request.user.is_superuser or request.user.id == event.user_id:
             context = {"event": event}
             return render(request, self.template_name, context)
         else:
             return HttpResponseForbidden()
 
     def post(self, request: HttpRequest, slug) -> HttpResponse:
-        event = get_object_or_404(Event, slug=slug)
-        if request.user.is_superuser or request.user == event.user:
+        queryset = Event.objects.filter(slug=slug)
+        if not request.user.is_superuser:
+            queryset = queryset.filter(user=request.user)
+        event = queryset.first()
+        if event is not None:
             event.delete()
             return redirect("events:home")
         else:
@@ -249,19 +403,21 @@ class SearchEventView(View):
     template_name: str = "search_events.html"
 
     def get(self, request: HttpRequest) -> HttpResponse:
-        print(request.GET)
         query = request.GET.get("search")
         if not query:
             return HttpResponse("The entry you made is invalid :( ")
         else:
-            if request.user.is_authenticated:
-                search_results = (
-                    Event.private.filter(name__icontains=query, user=request.user)
-                    | Event.public.filter(name__icontains=query)
-                ).distinct()
-            else:
-                search_results = Event.public.filter(name__icontains=query)
-        context = {"search_results": search_results, "query": query}
+            search_results, next_cursor = paginate_events(
+                Event.objects.filter(
+                    visible_events(request), name__icontains=query
+                ).only("name", "slug", "make_private", "date_of_event"),
+                request.GET.get("before"),
+            )
+        context = {
+            "search_results": search_results,
+            "query": query,
+            "next_cursor": next_cursor,
+        }
         return render(request, self.template_name, context)
 
 
@@ -270,19 +426,29 @@ class Attendlist(LoginRequiredMixin, View):
     template_name: str = "attend_list.html"
 
     def get(self, request: HttpRequest) -> HttpResponse:
-        all_events = Event.public.all()[:7]
-        attend_list = Event.public.filter(users_attending=request.user)
-        users_attending = []
-        for event in attend_list:
-            users_attending += event.users_attending.exclude(id=request.user.id)
-        users_count = len(users_attending)
-        max_attndts_events = {}
-        for events in all_events:
-            max_attndts_events[events] = events.users_attending.count()
+        attendance = Event.users_attending.through.objects
+        attendee = Event.users_attending.field.m2m_reverse_field_name()
+        all_events = Event.public.select_related("user").annotate(
+            attendees=Count("users_attending")
+        )[:7]
+        event_ids = attendance.filter(
+            **{attendee: request.user}, event__make_private=False
+        ).values_list("event_id", flat=True)
+        attend_list = (
+            Event.public.filter(id__in=event_ids)
+            .only(*EVENT_LIST_FIELDS)
+            .select_related("user")
+            .annotate(attendees=Count("users_attending"))
+        )
+        users_count = (
+            attendance.filter(event_id__in=event_ids)
+            .exclude(**{attendee: request.user})
+            .count()
+        )
         max_attndts_events = {
-            key: value
-            for key, value in sorted(
-                max_attndts_events.items(), key=lambda item: item[1], reverse=True
+            event: event.attendees
+            for event in sorted(
+                all_events, key=lambda event: event.attendees, reverse=True
             )
         }
         context = {